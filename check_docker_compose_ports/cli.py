@@ -4,7 +4,11 @@ CLI tool to check which ports defined in a docker-compose file are already in us
 """
 
 import argparse
+import errno
+import functools
+import io
 import json
+import logging
 import socket
 import subprocess
 import sys
@@ -12,91 +16,147 @@ import random
 import shutil
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Set, Tuple, Optional
+from typing import Any, Dict, FrozenSet, List, Set, Tuple, Optional
 
-import psutil
 import yaml
 
+# Prefer the libyaml-backed loader/dumper; PyYAML built without libyaml lacks them
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+log = logging.getLogger(__name__)
+
+# psutil is imported on first use, see _get_psutil(); False if it isn't installed
+_psutil = None
+
+_BRACE_VAR_RE = re.compile(r'\$\{([^}]+)\}')
+_SIMPLE_VAR_RE = re.compile(r'\$([A-Z_][A-Z0-9_]*)')
+_ENV_MATCH_RE = re.compile(r'\$\{([^}:-]+)|\$([A-Z_][A-Z0-9_]*)')
+_DOCKER_PORT_RE = re.compile(r':(\d+)(?:-(\d+))?->')
+_PORT_MAPPING_RE = re.compile(
+    r'^(?:(?:(?:(\d{1,3}(?:\.\d{1,3}){3})|\[([0-9A-Fa-f:.]+)\]):)?(\d+):)?(\d+)(?:/(tcp|udp|sctp))?$'
+)
+_PORT_RANGE_RE = re.compile(r'(\d{1,5})(?:-(\d{1,5}))?')
+_ENV_LINE_RE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*?)\s*$')
+
+# Resolved once; None when Docker isn't installed
+_DOCKER_BIN = shutil.which('docker')
+
+# dataclass(slots=True) is only available from Python 3.10
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class PortInfo:
+    """A single port mapping of a service and its availability."""
+    host_port: Optional[int] = None
+    host_ip: Optional[str] = None  # Only set when the mapping binds a specific address
+    container_port: Optional[int] = None
+    protocol: str = 'tcp'
+    original_mapping: Any = None
+    mapping_index: int = 0
+    env_var: Optional[str] = None  # Track if this port comes from an env var
+    resolved_mapping: Any = None  # Store the resolved version
+    available: bool = True
+    process: Optional[Dict[str, Any]] = None
+    docker_container: Optional[Dict[str, str]] = None
+
 
 def load_env_file(env_file_path: str) -> Dict[str, str]:
-    """Load environment variables from a .env file."""
-    env_vars = {}
-    if not os.path.exists(env_file_path):
-        return env_vars
+    """Load environment variables from a .env file.
 
+    Raises FileNotFoundError if the file doesn't exist.
+    """
+    env_vars = {}
     try:
         with open(env_file_path, 'r') as file:
-            for line_num, line in enumerate(file, 1):
-                line = line.strip()
-
+            for line in file:
                 # Skip empty lines and comments
-                if not line or line.startswith('#'):
+                if not line or line[0] == '#':
                     continue
 
                 # Handle KEY=VALUE format
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
+                match = _ENV_LINE_RE.match(line)
+                if not match:
+                    continue
+                key, value = match.group(1), match.group(2)
 
-                    # Remove quotes if present
-                    if (value.startswith('"') and value.endswith('"')) or \
-                       (value.startswith("'") and value.endswith("'")):
-                        value = value[1:-1]
+                # Remove quotes if present
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                    value = value[1:-1]
 
-                    env_vars[key] = value
+                env_vars[key] = value
+    except FileNotFoundError:
+        raise
     except Exception as e:
-        print(f"Warning: Error reading .env file '{env_file_path}': {e}")
+        log.warning("Error reading .env file '%s': %s", env_file_path, e)
 
     return env_vars
 
 
 def save_env_file(env_vars: Dict[str, str], env_file_path: str) -> None:
     """Save environment variables to a .env file while preserving format."""
-    if not os.path.exists(env_file_path):
-        # Create new .env file
-        with open(env_file_path, 'w') as file:
-            for key, value in env_vars.items():
-                file.write(f"{key}={value}\n")
-        return
-
-    # Read original file to preserve comments and formatting
     try:
-        with open(env_file_path, 'r') as file:
-            lines = file.readlines()
-
-        # Update existing variables and track what we've updated
-        updated_vars = set()
-
+        # Read original file to preserve comments and formatting
+        try:
+            with open(env_file_path, 'r') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            # Create new .env file
+            lines = []
+
+        # Index the line defining each variable in a single pass
+        key_to_idx = {}
         for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped and not stripped.startswith('#') and '=' in stripped:
-                key = stripped.split('=', 1)[0].strip()
-                if key in env_vars:
-                    # Update the line with new value
-                    lines[i] = f"{key}={env_vars[key]}\n"
-                    updated_vars.add(key)
-
-        # Add any new variables that weren't in the original file
+            match = _ENV_LINE_RE.match(line)
+            if match:
+                key_to_idx[match.group(1)] = i
+
+        # Update existing variables in place and append new ones
         for key, value in env_vars.items():
-            if key not in updated_vars:
+            if key in key_to_idx:
+                lines[key_to_idx[key]] = f"{key}={value}\n"
+            else:
                 lines.append(f"{key}={value}\n")
 
         # Write back to file
         with open(env_file_path, 'w') as file:
-            file.writelines(lines)
+            file.write(''.join(lines))
 
     except Exception as e:
-        print(f"Error updating .env file '{env_file_path}': {e}")
+        log.error("Error updating .env file '%s': %s", env_file_path, e)
         sys.exit(1)
 
 
-def resolve_env_variables(value: str, env_vars: Dict[str, str]) -> str:
-    """Resolve environment variable substitutions in a string."""
-    if not isinstance(value, str):
+def _env_cache_key(env_vars: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """Build a hashable key for env_vars, used to memoize resolve_env_variables."""
+    return tuple(sorted(env_vars.items()))
+
+
+def resolve_env_variables(value: str, env_vars: Dict[str, str],
+                          env_key: Tuple[Tuple[str, str], ...] = None) -> str:
+    """Resolve environment variable substitutions in a string.
+
+    Callers resolving many values against the same env_vars can pass a
+    precomputed env_key (see _env_cache_key) to avoid rebuilding it per value.
+    """
+    # Nothing to substitute without a '$', which covers most port strings
+    if not isinstance(value, str) or '$' not in value:
         return value
 
+    if env_key is None:
+        env_key = _env_cache_key(env_vars)
+    return _resolve_cached(value, env_key)
+
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_cached(value: str, env_key: Tuple[Tuple[str, str], ...]) -> str:
+    """Resolve a value against the env vars captured in env_key."""
+    env_vars = dict(env_key)
+
     # Handle ${VAR} and ${VAR:-default} patterns
     def replace_var(match):
         var_expr = match.group(1)
@@ -109,51 +169,46 @@ def resolve_env_variables(value: str, env_vars: Dict[str, str]) -> str:
             return env_vars.get(var_expr, '')
 
     # Replace ${VAR} and ${VAR:-default} patterns
-    result = re.sub(r'\$\{([^}]+)\}', replace_var, value)
+    result = _BRACE_VAR_RE.sub(replace_var, value)
 
     # Handle $VAR patterns (without braces)
     def replace_simple_var(match):
         var_name = match.group(1)
         return env_vars.get(var_name, '')
 
-    result = re.sub(r'\$([A-Z_][A-Z0-9_]*)', replace_simple_var, result)
+    result = _SIMPLE_VAR_RE.sub(replace_simple_var, result)
 
     return result
 
 
+def _add_env_var_names(value: str, port_env_vars: Set[str]) -> None:
+    """Add the names of environment variables referenced in a port string."""
+    # Extract ${VAR} and ${VAR:-default} references
+    for env_var in _BRACE_VAR_RE.findall(value):
+        # Handle default values: ${VAR:-default}
+        port_env_vars.add(env_var.split(':-', 1)[0])
+
+    # Also check for simple $VAR patterns
+    port_env_vars.update(_SIMPLE_VAR_RE.findall(value))
+
+
 def extract_env_port_variables(compose_data: dict) -> Set[str]:
     """Extract environment variable names that are used for port configuration."""
     port_env_vars = set()
 
-    def find_port_vars_recursive(obj, path=""):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                current_path = f"{path}.{key}" if path else key
-
-                # Check if this is a ports configuration
-                if key == 'ports' and isinstance(value, list):
-                    for port_mapping in value:
-                        if isinstance(port_mapping, str):
-                            # Extract environment variables from port strings
-                            env_vars_in_string = re.findall(r'\$\{([^}]+)\}', port_mapping)
-                            for env_var in env_vars_in_string:
-                                # Handle default values: ${VAR:-default}
-                                if ':-' in env_var:
-                                    var_name = env_var.split(':-', 1)[0]
-                                else:
-                                    var_name = env_var
-                                port_env_vars.add(var_name)
-
-                            # Also check for simple $VAR patterns
-                            simple_vars = re.findall(r'\$([A-Z_][A-Z0-9_]*)', port_mapping)
-                            port_env_vars.update(simple_vars)
-
-                find_port_vars_recursive(value, current_path)
-        elif isinstance(obj, list):
-            for i, item in enumerate(obj):
-                find_port_vars_recursive(item, f"{path}[{i}]")
-
-    find_port_vars_recursive(compose_data)
+    # Ports only live under services.<name>.ports, so sweep just that subtree
+    for config in compose_data.get('services', {}).values():
+        for port_mapping in config.get('ports', []):
+            # Plain mappings like "8080:80" can't reference a variable
+            if isinstance(port_mapping, str):
+                if '$' in port_mapping:
+                    _add_env_var_names(port_mapping, port_env_vars)
+            elif isinstance(port_mapping, dict):
+                # Long format with published/target keys
+                for value in (port_mapping.get('published'), port_mapping.get('target')):
+                    if isinstance(value, str) and '$' in value:
+                        _add_env_var_names(value, port_env_vars)
+
     return port_env_vars
 
 
@@ -161,15 +216,15 @@ def load_docker_compose(file_path: str) -> dict:
     """Load and parse a docker-compose.yml file."""
     try:
         with open(file_path, 'r') as file:
-            return yaml.safe_load(file)
+            return yaml.load(file, Loader=_YAML_LOADER)
     except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found")
+        log.error("File '%s' not found", file_path)
         sys.exit(1)
     except yaml.YAMLError as e:
-        print(f"Error parsing YAML file '{file_path}': {e}")
+        log.error("Error parsing YAML file '%s': %s", file_path, e)
         sys.exit(1)
     except Exception as e:
-        print(f"Error reading '{file_path}': {e}")
+        log.error("Error reading '%s': %s", file_path, e)
         sys.exit(1)
 
 
@@ -177,43 +232,247 @@ def save_docker_compose(compose_data: dict, file_path: str) -> None:
     """Save docker-compose data to a YAML file."""
     try:
         with open(file_path, 'w') as file:
-            yaml.dump(compose_data, file, default_flow_style=False, sort_keys=False)
+            yaml.dump(compose_data, file, Dumper=_YAML_DUMPER, default_flow_style=False, sort_keys=False)
     except Exception as e:
-        print(f"Error writing to '{file_path}': {e}")
+        log.error("Error writing to '%s': %s", file_path, e)
         sys.exit(1)
 
 
-def find_available_port(start_port: int = 8000, end_port: int = 65535, exclude_ports: Set[int] = None) -> int:
+def _get_psutil():
+    """Import psutil on first use; most runs never need it.
+
+    Returns None if psutil isn't installed, which is optional on Linux.
+    """
+    global _psutil
+    if _psutil is None:
+        try:
+            import psutil
+            _psutil = psutil
+        except ImportError:
+            log.debug("psutil is not installed, process details are unavailable")
+            _psutil = False
+    return _psutil or None
+
+
+def _snapshot_listening() -> Dict[int, object]:
+    """Take a single snapshot of the listening TCP sockets, keyed by port."""
+    psutil = _get_psutil()
+    if psutil is None:
+        return {}
+    try:
+        return {
+            conn.laddr.port: conn
+            for conn in psutil.net_connections(kind='tcp')
+            if conn.status == psutil.CONN_LISTEN
+        }
+    except psutil.AccessDenied:
+        return {}
+
+
+def _linux_listening_ports() -> Set[int]:
+    """Read the listening TCP ports straight from /proc/net/tcp{,6}.
+
+    Unlike psutil this skips walking every process's file descriptors, which
+    is only needed to attribute sockets to PIDs.
+    """
+    ports = set()
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            # tcp6 is missing when IPv6 is disabled
+            if path == '/proc/net/tcp':
+                raise
+            continue
+
+        # Columns: sl local_address rem_address st ...; st 0A is LISTEN
+        for line in data.splitlines()[1:]:
+            fields = line.split()
+            if len(fields) > 3 and fields[3] == b'0A':
+                ports.add(int(fields[1].rsplit(b':', 1)[1], 16))
+    return ports
+
+
+def _listening_ports() -> Set[int]:
+    """Collect just the listening TCP port numbers."""
+    if sys.platform.startswith('linux'):
+        try:
+            return _linux_listening_ports()
+        except OSError:
+            pass
+
+    psutil = _get_psutil()
+    if psutil is None:
+        return set()
+    try:
+        return {
+            conn.laddr.port
+            for conn in psutil.net_connections(kind='tcp')
+            if conn.status == psutil.CONN_LISTEN
+        }
+    except psutil.AccessDenied:
+        return set()
+
+
+def _port_free(port: int, listening_set) -> bool:
+    """Check a port against the listening snapshot without touching the kernel."""
+    return port not in listening_set
+
+
+def find_available_port(start_port: int = 8000, end_port: int = 65535, exclude_ports: Set[int] = None,
+                        listening: FrozenSet[int] = None) -> int:
     """Find an available port in the specified range."""
     if exclude_ports is None:
         exclude_ports = set()
 
     # Get currently used ports
-    used_ports = {conn.laddr.port for conn in psutil.net_connections(kind='inet') if conn.status == psutil.CONN_LISTEN}
-    used_ports.update(exclude_ports)
+    if listening is None:
+        used_ports = _listening_ports()
+        used_ports |= exclude_ports
+    else:
+        used_ports = listening | exclude_ports
 
-    # Try random ports first to avoid sequential allocation
-    attempts = 0
-    max_attempts = 1000
+    candidates = range(start_port, end_port + 1)
 
-    while attempts < max_attempts:
-        port = random.randint(start_port, end_port)
-        if port not in used_ports and not is_port_in_use(port):
-            return port
-        attempts += 1
+    # Random draws avoid sequential allocation and, on a large range that
+    # is mostly free, find a port without listing the whole range
+    if len(candidates) > 1024:
+        for port in random.sample(candidates, 64):
+            if _port_free(port, used_ports) and not is_port_in_use(port):
+                return port
+
+    # Small or nearly full range: walk every free port in random order
+    free_ports = [port for port in candidates if _port_free(port, used_ports)]
+    random.shuffle(free_ports)
 
-    # Fallback to sequential search
-    for port in range(start_port, end_port + 1):
-        if port not in used_ports and not is_port_in_use(port):
+    for port in free_ports:
+        # Only confirm with a real bind() once the snapshot says it's free
+        if not is_port_in_use(port):
             return port
 
     raise RuntimeError(f"No available ports found in range {start_port}-{end_port}")
 
 
-def extract_service_ports(compose_data: dict, env_vars: Dict[str, str] = None) -> Dict[str, Dict]:
-    """Extract port information for each service in the docker-compose file."""
+def _parse_port_string(port_mapping: str, port_info: PortInfo) -> None:
+    """Parse port strings the single-pass regex doesn't cover (host IPs, ranges, ...)."""
+    # Handle "host:container" format
+    if ':' in port_mapping:
+        parts = port_mapping.split(':')
+        if len(parts) >= 2:
+            host_part = parts[0]
+            container_part = parts[1]
+            if host_part.isdigit():
+                port_info.host_port = int(host_part)
+            if container_part.isdigit():
+                port_info.container_port = int(container_part)
+            else:
+                # Handle container_port/protocol format
+                if '/' in container_part:
+                    container_port, protocol = container_part.split('/')
+                    if container_port.isdigit():
+                        port_info.container_port = int(container_port)
+                    port_info.protocol = protocol
+                elif container_part.isdigit():
+                    port_info.container_port = int(container_part)
+    else:
+        # Handle single port format
+        if port_mapping.isdigit():
+            port_info.host_port = int(port_mapping)
+            port_info.container_port = int(port_mapping)
+        elif '/' in port_mapping:
+            port_part, protocol = port_mapping.split('/')
+            if port_part.isdigit():
+                port_info.host_port = int(port_part)
+                port_info.container_port = int(port_part)
+            port_info.protocol = protocol
+
+
+def _build_port_info(port_mapping: Any, mapping_index: int, env_vars: Dict[str, str],
+                     env_key: Tuple[Tuple[str, str], ...], port_env_vars: Set[str] = None) -> PortInfo:
+    """Parse a single entry of a service's ports list.
+
+    Names of env vars referenced by the entry are added to port_env_vars if given.
+    """
+    port_info = PortInfo(original_mapping=port_mapping, mapping_index=mapping_index, resolved_mapping=port_mapping)
+
+    # Resolve environment variables in the port mapping
+    if isinstance(port_mapping, str):
+        if port_env_vars is not None and '$' in port_mapping:
+            _add_env_var_names(port_mapping, port_env_vars)
+
+        resolved_mapping = resolve_env_variables(port_mapping, env_vars, env_key)
+        port_info.resolved_mapping = resolved_mapping
+
+        # Check if this mapping uses environment variables
+        env_match = _ENV_MATCH_RE.search(port_mapping) if '$' in port_mapping else None
+        if env_match:
+            # Extract the environment variable name
+            port_info.env_var = env_match.group(1) or env_match.group(2)
+
+        port_mapping = resolved_mapping
+
+    if isinstance(port_mapping, str):
+        # Handle "port", "[ip:]host:container" and optional "/protocol" in one match
+        match = _PORT_MAPPING_RE.match(port_mapping)
+        if match:
+            ipv4, ipv6, host_part, container_part, protocol = match.group(1, 2, 3, 4, 5)
+            port_info.host_ip = ipv4 or ipv6
+            container_port = int(container_part)
+            port_info.host_port = int(host_part) if host_part else container_port
+            port_info.container_port = container_port
+            if protocol:
+                port_info.protocol = protocol
+        else:
+            _parse_port_string(port_mapping, port_info)
+    elif isinstance(port_mapping, int):
+        # Handle numeric port
+        port_info.host_port = port_mapping
+        port_info.container_port = port_mapping
+    elif isinstance(port_mapping, dict):
+        # Handle long format with published/target keys
+        published = port_mapping.get('published')
+        target = port_mapping.get('target')
+        protocol = port_mapping.get('protocol', 'tcp')
+
+        if port_env_vars is not None:
+            for value in (published, target):
+                if isinstance(value, str) and '$' in value:
+                    _add_env_var_names(value, port_env_vars)
+
+        if published and isinstance(published, (int, str)):
+            if isinstance(published, str):
+                published = resolve_env_variables(published, env_vars, env_key)
+                if published.isdigit():
+                    port_info.host_port = int(published)
+            elif isinstance(published, int):
+                port_info.host_port = published
+
+        if target and isinstance(target, (int, str)):
+            if isinstance(target, str):
+                target = resolve_env_variables(target, env_vars, env_key)
+                if target.isdigit():
+                    port_info.container_port = int(target)
+            elif isinstance(target, int):
+                port_info.container_port = target
+
+        port_info.protocol = protocol
+        port_info.host_ip = port_mapping.get('host_ip')
+
+    return port_info
+
+
+def extract_ports_and_env(compose_data: dict,
+                          env_vars: Dict[str, str] = None) -> Tuple[Dict[str, Dict], Set[str]]:
+    """Extract port information for each service and the env vars its ports use.
+
+    Both come out of a single traversal; the env var names are the same ones
+    extract_env_port_variables would report.
+    """
     if env_vars is None:
         env_vars = {}
+    env_key = _env_cache_key(env_vars)
+    port_env_vars = set()
 
     services_info = {}
     services = compose_data.get('services', {})
@@ -228,231 +487,277 @@ def extract_service_ports(compose_data: dict, env_vars: Dict[str, str] = None) -
         port_mappings = config.get('ports', [])
 
         for i, port_mapping in enumerate(port_mappings):
-            port_info = {
-                'host_port': None,
-                'container_port': None,
-                'protocol': 'tcp',
-                'original_mapping': port_mapping,
-                'mapping_index': i,
-                'env_var': None,  # Track if this port comes from an env var
-                'resolved_mapping': port_mapping  # Store the resolved version
-            }
+            port_info = _build_port_info(port_mapping, i, env_vars, env_key, port_env_vars)
 
-            # Resolve environment variables in the port mapping
-            if isinstance(port_mapping, str):
-                resolved_mapping = resolve_env_variables(port_mapping, env_vars)
-                port_info['resolved_mapping'] = resolved_mapping
+            if port_info.host_port is not None:
+                service_info['ports'].append(port_info)
 
-                # Check if this mapping uses environment variables
-                if re.search(r'\$\{[^}]+\}|\$[A-Z_][A-Z0-9_]*', port_mapping):
-                    # Extract the environment variable name
-                    env_match = re.search(r'\$\{([^}:-]+)', port_mapping) or re.search(r'\$([A-Z_][A-Z0-9_]*)', port_mapping)
-                    if env_match:
-                        port_info['env_var'] = env_match.group(1)
+        services_info[service_name] = service_info
 
-                port_mapping = resolved_mapping
+    return services_info, port_env_vars
 
-            if isinstance(port_mapping, str):
-                # Handle "host:container" format
-                if ':' in port_mapping:
-                    parts = port_mapping.split(':')
-                    if len(parts) >= 2:
-                        host_part = parts[0]
-                        container_part = parts[1]
-                        if host_part.isdigit():
-                            port_info['host_port'] = int(host_part)
-                        if container_part.isdigit():
-                            port_info['container_port'] = int(container_part)
-                        else:
-                            # Handle container_port/protocol format
-                            if '/' in container_part:
-                                container_port, protocol = container_part.split('/')
-                                if container_port.isdigit():
-                                    port_info['container_port'] = int(container_port)
-                                port_info['protocol'] = protocol
-                            elif container_part.isdigit():
-                                port_info['container_port'] = int(container_part)
-                else:
-                    # Handle single port format
-                    if port_mapping.isdigit():
-                        port_info['host_port'] = int(port_mapping)
-                        port_info['container_port'] = int(port_mapping)
-                    elif '/' in port_mapping:
-                        port_part, protocol = port_mapping.split('/')
-                        if port_part.isdigit():
-                            port_info['host_port'] = int(port_part)
-                            port_info['container_port'] = int(port_part)
-                        port_info['protocol'] = protocol
-            elif isinstance(port_mapping, int):
-                # Handle numeric port
-                port_info['host_port'] = port_mapping
-                port_info['container_port'] = port_mapping
-            elif isinstance(port_mapping, dict):
-                # Handle long format with published/target keys
-                published = port_mapping.get('published')
-                target = port_mapping.get('target')
-                protocol = port_mapping.get('protocol', 'tcp')
-
-                if published and isinstance(published, (int, str)):
-                    if isinstance(published, str):
-                        published = resolve_env_variables(published, env_vars)
-                        if published.isdigit():
-                            port_info['host_port'] = int(published)
-                    elif isinstance(published, int):
-                        port_info['host_port'] = published
-
-                if target and isinstance(target, (int, str)):
-                    if isinstance(target, str):
-                        target = resolve_env_variables(target, env_vars)
-                        if target.isdigit():
-                            port_info['container_port'] = int(target)
-                    elif isinstance(target, int):
-                        port_info['container_port'] = target
-
-                port_info['protocol'] = protocol
-
-            if port_info['host_port'] is not None:
-                service_info['ports'].append(port_info)
 
-        services_info[service_name] = service_info
+def extract_service_ports(compose_data: dict, env_vars: Dict[str, str] = None) -> Dict[str, Dict]:
+    """Extract port information for each service in the docker-compose file."""
+    return extract_ports_and_env(compose_data, env_vars)[0]
 
-    return services_info
+
+def _uses_env_var(port_mapping: Any) -> bool:
+    """Check whether a ports entry references an env var."""
+    if isinstance(port_mapping, str):
+        return '$' in port_mapping
+    if isinstance(port_mapping, dict):
+        return any(
+            isinstance(value, str) and '$' in value
+            for value in (port_mapping.get('published'), port_mapping.get('target'))
+        )
+    return False
 
 
-def get_process_using_port(port: int) -> Optional[Tuple[int, str]]:
+def _resolve_env_ports(compose_data: dict, services_info: Dict[str, Dict], env_vars: Dict[str, str]) -> None:
+    """Re-parse only the port entries that reference env vars, resolved against env_vars."""
+    env_key = _env_cache_key(env_vars)
+    services = compose_data.get('services', {})
+
+    for service_name, service_info in services_info.items():
+        port_mappings = services[service_name].get('ports', [])
+        if not any(_uses_env_var(port_mapping) for port_mapping in port_mappings):
+            continue
+
+        # Literal entries keep their PortInfo from the first pass
+        parsed = {port_info.mapping_index: port_info for port_info in service_info['ports']}
+        ports = []
+        for i, port_mapping in enumerate(port_mappings):
+            if _uses_env_var(port_mapping):
+                port_info = _build_port_info(port_mapping, i, env_vars, env_key)
+                if port_info.host_port is not None:
+                    ports.append(port_info)
+            elif i in parsed:
+                ports.append(parsed[i])
+        service_info['ports'] = ports
+
+
+def get_process_using_port(port: int, snapshot: Dict[int, object] = None) -> Optional[Tuple[int, str]]:
     """Get the PID and process name using a specific port."""
-    try:
-        for conn in psutil.net_connections(kind='inet'):
-            if conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
-                if conn.pid:
-                    try:
-                        process = psutil.Process(conn.pid)
-                        return conn.pid, process.name()
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        return conn.pid, "unknown"
-                return None, "unknown"
-    except (psutil.AccessDenied, psutil.NoSuchProcess):
-        pass
-    return None
+    if snapshot is None:
+        snapshot = _snapshot_listening()
+
+    conn = snapshot.get(port)
+    if conn is None:
+        return None
+
+    if conn.pid:
+        psutil = _get_psutil()
+        try:
+            process = psutil.Process(conn.pid)
+            return conn.pid, process.name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return conn.pid, "unknown"
+    return None, "unknown"
 
 
 def is_port_in_use(port: int) -> bool:
-    """Check if a port is in use by trying to bind to it."""
+    """Check if a port is in use by trying to bind and listen on it.
+
+    This costs several syscalls, so callers check the listening snapshot
+    first and only use it to confirm ports the snapshot reports as free.
+    """
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setblocking(False)
+            # Ignore TIME_WAIT sockets left by closed connections, as Docker does
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind(("0.0.0.0", port))
+            # listen() fails if another socket is already listening on the port
+            s.listen(1)
             return False
     except OSError:
         return True
 
 
-def get_docker_container_info(port: int) -> Optional[Dict[str, str]]:
-    """Get Docker container information for a port if it's used by Docker."""
+def _build_docker_port_map() -> Dict[int, Dict[str, str]]:
+    """Map published host ports to their Docker containers with a single `docker ps`."""
+    port_map = {}
+    if _DOCKER_BIN is None:
+        return port_map
+
     try:
-        # Get all running containers
         result = subprocess.run(
-            ["docker", "ps", "--format", "{{.ID}}\t{{.Names}}\t{{.Image}}"],
+            [_DOCKER_BIN, "ps", "--format", "{{.ID}}\t{{.Names}}\t{{.Image}}\t{{.Ports}}"],
             capture_output=True, text=True, check=True
         )
-
-        for line in result.stdout.strip().split('\n'):
-            if not line.strip():
-                continue
-
-            parts = line.strip().split('\t')
-            if len(parts) >= 3:
-                container_id, name, image = parts[0], parts[1], parts[2]
-
-                # Check port mappings for this container
-                port_result = subprocess.run(
-                    ["docker", "port", container_id],
-                    capture_output=True, text=True, check=True
-                )
-
-                for port_line in port_result.stdout.strip().split('\n'):
-                    if not port_line.strip():
-                        continue
-
-                    # Parse port mapping like "80/tcp -> 0.0.0.0:8080"
-                    if '->' in port_line and f":{port}" in port_line:
-                        return {
-                            "container_id": container_id,
-                            "container_name": name,
-                            "image": image
-                        }
     except (subprocess.CalledProcessError, FileNotFoundError):
         # Docker not available or command failed
-        pass
+        return port_map
+
+    for line in result.stdout.splitlines():
+        parts = line.strip().split('\t')
+        if len(parts) < 4:
+            continue
+
+        container_id, name, image, ports = parts[0], parts[1], parts[2], parts[3]
+        container = {
+            "container_id": container_id,
+            "container_name": name,
+            "image": image
+        }
+
+        # Parse published ports like "0.0.0.0:8080->80/tcp" or "0.0.0.0:8000-8002->8000-8002/tcp"
+        for match in _DOCKER_PORT_RE.finditer(ports):
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) else first
+            for host_port in range(first, last + 1):
+                port_map.setdefault(host_port, container)
 
-    return None
+    return port_map
+
+
+def get_docker_container_info(port: int, docker_ports: Dict[int, Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """Get Docker container information for a port if it's used by Docker."""
+    if _DOCKER_BIN is None:
+        return None
+    if docker_ports is None:
+        docker_ports = _build_docker_port_map()
+    return docker_ports.get(port)
+
+
+def _is_port_free(host: Optional[str], port: int) -> bool:
+    """Check whether a port can be bound on host.
+
+    Wildcard hosts are probed on both IPv4 and IPv6, as Docker publishes on both.
+    """
+    if not host or host == '0.0.0.0':
+        targets = [(socket.AF_INET, '0.0.0.0'), (socket.AF_INET6, '::')]
+    elif ':' in host:
+        targets = [(socket.AF_INET6, host)]
+    else:
+        targets = [(socket.AF_INET, host)]
+
+    for family, address in targets:
+        try:
+            s = socket.socket(family, socket.SOCK_STREAM)
+        except OSError:
+            # Address family not supported on this host
+            continue
+
+        with s:
+            # Like Docker, ignore TIME_WAIT sockets; live listeners still fail the bind
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if family == socket.AF_INET6:
+                # Keep the IPv6 probe from also covering IPv4
+                s.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            try:
+                s.bind((address, port))
+            except OSError as e:
+                # Other errors, e.g. an address this host doesn't have, aren't conflicts
+                if e.errno == errno.EADDRINUSE:
+                    return False
+    return True
+
+
+def _mark_availability(port_info: PortInfo) -> bool:
+    """Set the availability fields of a port entry and return whether it's available."""
+    port_info.available = _is_port_free(port_info.host_ip, port_info.host_port)
+    port_info.process = None
+    port_info.docker_container = None
+    return port_info.available
+
+
+def _check_ports(port_infos: List[PortInfo]) -> List[PortInfo]:
+    """Probe ports, mark their availability and return the unavailable ones."""
+    # A bind() probe takes microseconds, so a thread pool would cost more than it saves
+    return [port_info for port_info in port_infos if not _mark_availability(port_info)]
+
+
+def _describe_conflicts(conflicts: List[PortInfo]) -> None:
+    """Attach process and Docker container details to unavailable ports."""
+    if not conflicts:
+        return
+
+    # Only conflicts need PIDs, so the full psutil snapshot is taken here
+    snapshot = _snapshot_listening()
+
+    # Both lookups wait on I/O (docker subprocess, /proc reads), so overlap them
+    ports = list(dict.fromkeys(port_info.host_port for port_info in conflicts))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        docker_future = executor.submit(_build_docker_port_map)
+        processes = dict(zip(ports, executor.map(
+            functools.partial(get_process_using_port, snapshot=snapshot), ports
+        )))
+        docker_ports = docker_future.result()
+
+    for port_info in conflicts:
+        host_port = port_info.host_port
+
+        # Get process information
+        process_info = processes[host_port]
+        if process_info and process_info[0] is not None:
+            port_info.process = {
+                "pid": process_info[0],
+                "name": process_info[1]
+            }
+
+        # Check if it's a Docker container
+        docker_info = get_docker_container_info(host_port, docker_ports)
+        if docker_info:
+            port_info.docker_container = docker_info
+
+
+def _check_service_ports(services_info: Dict[str, Dict]) -> int:
+    """Add availability information to all services and return the number of ports in use."""
+    to_check = [
+        port_info
+        for service_info in services_info.values()
+        for port_info in service_info['ports']
+        if port_info.host_port
+    ]
+    conflicts = _check_ports(to_check)
+    _describe_conflicts(conflicts)
+
+    return len(conflicts)
 
 
 def check_service_ports(services_info: Dict[str, Dict]) -> Dict[str, Dict]:
     """Check port usage for all services and add availability information."""
-    for service_name, service_info in services_info.items():
-        for port_info in service_info['ports']:
-            host_port = port_info['host_port']
-
-            if host_port:
-                port_info['available'] = not is_port_in_use(host_port)
-                port_info['process'] = None
-                port_info['docker_container'] = None
-
-                if not port_info['available']:
-                    # Get process information
-                    process_info = get_process_using_port(host_port)
-                    if process_info and process_info[0] is not None:
-                        port_info['process'] = {
-                            "pid": process_info[0],
-                            "name": process_info[1]
-                        }
-
-                    # Check if it's a Docker container
-                    docker_info = get_docker_container_info(host_port)
-                    if docker_info:
-                        port_info['docker_container'] = docker_info
-
+    _check_service_ports(services_info)
     return services_info
 
 
 def resolve_port_conflicts(compose_data: dict, services_info: Dict[str, Dict],
                          interactive: bool = False, port_range: Tuple[int, int] = (8000, 65535),
-                         env_vars: Dict[str, str] = None, env_file_path: str = None) -> Tuple[Dict, Dict[str, str]]:
+                         env_vars: Dict[str, str] = None, env_file_path: str = None,
+                         listening: FrozenSet[int] = None) -> Tuple[Dict, Dict[str, str]]:
     """Resolve port conflicts by changing ports in the docker-compose data and/or .env file."""
     if env_vars is None:
         env_vars = {}
+    if listening is None:
+        listening = frozenset(_listening_ports())
 
     changes_made = {}
     env_changes = {}
-    used_ports = set()  # Track ports we've already assigned
-
-    # Collect all currently used ports
-    for conn in psutil.net_connections(kind='inet'):
-        if conn.status == psutil.CONN_LISTEN:
-            used_ports.add(conn.laddr.port)
+    used_ports = set(listening)  # Track ports we've already assigned
 
     for service_name, service_info in services_info.items():
         service_changes = []
 
         for port_info in service_info['ports']:
-            if not port_info.get('available', True):
-                old_port = port_info['host_port']
+            if not port_info.available:
+                old_port = port_info.host_port
 
                 if interactive:
                     # Interactive mode: ask user for new port
                     while True:
                         try:
                             print(f"\n🔧 Service '{service_name}' port {old_port} is in use")
-                            if port_info.get('process'):
-                                pid = port_info['process']['pid']
-                                name = port_info['process']['name']
+                            if port_info.process:
+                                pid = port_info.process['pid']
+                                name = port_info.process['name']
                                 print(f"   Used by: {name} (PID: {pid})")
 
                             new_port_input = input(f"   Enter new port for {old_port} (or 'auto' for automatic): ").strip()
 
                             if new_port_input.lower() == 'auto':
-                                new_port = find_available_port(port_range[0], port_range[1], used_ports)
+                                new_port = find_available_port(port_range[0], port_range[1], used_ports, listening)
                                 break
                             else:
                                 new_port = int(new_port_input)
@@ -468,33 +773,38 @@ def resolve_port_conflicts(compose_data: dict, services_info: Dict[str, Dict],
                             sys.exit(1)
                 else:
                     # Automatic mode: find available port
-                    new_port = find_available_port(port_range[0], port_range[1], used_ports)
+                    new_port = find_available_port(port_range[0], port_range[1], used_ports, listening)
 
                 # Track the new port to avoid conflicts
                 used_ports.add(new_port)
 
                 # Check if this port comes from an environment variable
-                if port_info.get('env_var') and env_file_path:
+                if port_info.env_var and env_file_path:
                     # Update the environment variable instead of the docker-compose file
-                    env_var_name = port_info['env_var']
+                    env_var_name = port_info.env_var
                     env_changes[env_var_name] = str(new_port)
                     env_vars[env_var_name] = str(new_port)  # Update for immediate use
                 else:
                     # Update the docker-compose data directly
                     service_config = compose_data['services'][service_name]
-                    mapping_index = port_info['mapping_index']
-                    original_mapping = port_info['original_mapping']
+                    mapping_index = port_info.mapping_index
+                    original_mapping = port_info.original_mapping
 
                     # Create new mapping based on original format
                     if isinstance(original_mapping, str):
                         if ':' in original_mapping:
-                            # "host:container" format
-                            parts = original_mapping.split(':')
-                            new_mapping = f"{new_port}:{parts[1]}"
+                            # "[ip:]host:container" format
+                            container_part = original_mapping.rsplit(':', 1)[1]
+                            new_mapping = f"{new_port}:{container_part}"
+                            if port_info.host_ip:
+                                host_ip = port_info.host_ip
+                                if ':' in host_ip:
+                                    host_ip = f"[{host_ip}]"
+                                new_mapping = f"{host_ip}:{new_mapping}"
                         else:
                             # Single port format
-                            if port_info['protocol'] != 'tcp':
-                                new_mapping = f"{new_port}/{port_info['protocol']}"
+                            if port_info.protocol != 'tcp':
+                                new_mapping = f"{new_port}/{port_info.protocol}"
                             else:
                                 new_mapping = str(new_port)
                     elif isinstance(original_mapping, int):
@@ -511,10 +821,10 @@ def resolve_port_conflicts(compose_data: dict, services_info: Dict[str, Dict],
                 service_changes.append({
                     'old_port': old_port,
                     'new_port': new_port,
-                    'container_port': port_info['container_port'],
-                    'protocol': port_info['protocol'],
-                    'env_var': port_info.get('env_var'),
-                    'updated_via_env': port_info.get('env_var') is not None
+                    'container_port': port_info.container_port,
+                    'protocol': port_info.protocol,
+                    'env_var': port_info.env_var,
+                    'updated_via_env': port_info.env_var is not None
                 })
 
         if service_changes:
@@ -525,53 +835,50 @@ def resolve_port_conflicts(compose_data: dict, services_info: Dict[str, Dict],
 
 def format_beautiful_output(services_info: Dict[str, Dict], env_file_path: str = None, uses_env_vars: bool = False) -> str:
     """Format the output in a beautiful, structured way."""
-    output_lines = []
+    buf = io.StringIO()
+    w = buf.write
 
     # Header
-    output_lines.append("🐳 Docker Compose Port Analysis")
-    output_lines.append("=" * 50)
-    output_lines.append("")
+    w("🐳 Docker Compose Port Analysis\n")
+    w("=" * 50 + "\n\n")
 
     # Show environment variable info if applicable
     if uses_env_vars and env_file_path:
-        output_lines.append(f"🌍 Using environment file: {env_file_path}")
-        output_lines.append("")
+        w(f"🌍 Using environment file: {env_file_path}\n\n")
 
     if not services_info:
-        output_lines.append("❌ No services found in docker-compose file")
-        return "\n".join(output_lines)
+        w("❌ No services found in docker-compose file")
+        return buf.getvalue()
 
     total_ports = sum(len(service['ports']) for service in services_info.values())
     used_ports = sum(
         1 for service in services_info.values()
         for port in service['ports']
-        if not port.get('available', True)
+        if not port.available
     )
 
     # Summary
-    output_lines.append(f"📊 Summary: {len(services_info)} services, {total_ports} ports configured")
+    w(f"📊 Summary: {len(services_info)} services, {total_ports} ports configured\n")
     if used_ports == 0:
-        output_lines.append("✅ All ports are available!")
+        w("✅ All ports are available!\n\n")
     else:
-        output_lines.append(f"⚠️  {used_ports} port(s) in use")
-    output_lines.append("")
+        w(f"⚠️  {used_ports} port(s) in use\n\n")
 
     # Service details
     for service_name, service_info in services_info.items():
-        output_lines.append(f"🔧 Service: {service_name}")
-        output_lines.append(f"   📦 Image: {service_info['image']}")
+        w(f"🔧 Service: {service_name}\n   📦 Image: {service_info['image']}\n")
 
         if not service_info['ports']:
-            output_lines.append("   🔌 Ports: None configured")
+            w("   🔌 Ports: None configured\n")
         else:
-            output_lines.append("   🔌 Ports:")
+            w("   🔌 Ports:\n")
 
             for port_info in service_info['ports']:
-                host_port = port_info['host_port']
-                container_port = port_info['container_port']
-                protocol = port_info['protocol']
-                available = port_info.get('available', True)
-                env_var = port_info.get('env_var')
+                host_port = port_info.host_port
+                container_port = port_info.container_port
+                protocol = port_info.protocol
+                available = port_info.available
+                env_var = port_info.env_var
 
                 # Format port mapping
                 if host_port == container_port:
@@ -586,23 +893,24 @@ def format_beautiful_output(services_info: Dict[str, Dict], env_file_path: str =
                 # Status indicator
                 status = "✅ Available" if available else "❌ In Use"
 
-                output_lines.append(f"      └─ {port_display} - {status}")
+                w(f"      └─ {port_display} - {status}\n")
 
                 # Additional details for ports in use
                 if not available:
-                    if port_info.get('process'):
-                        pid = port_info['process']['pid']
-                        name = port_info['process']['name']
-                        output_lines.append(f"         └─ Process: {name} (PID: {pid})")
+                    if port_info.process:
+                        pid = port_info.process['pid']
+                        name = port_info.process['name']
+                        w(f"         └─ Process: {name} (PID: {pid})\n")
 
-                    if port_info.get('docker_container'):
-                        container = port_info['docker_container']
-                        output_lines.append(f"         └─ Docker: {container['container_name']}")
-                        output_lines.append(f"            Image: {container['image']}")
+                    if port_info.docker_container:
+                        container = port_info.docker_container
+                        w(f"         └─ Docker: {container['container_name']}\n"
+                          f"            Image: {container['image']}\n")
 
-        output_lines.append("")
+        w("\n")
 
-    return "\n".join(output_lines)
+    # Every line above is newline-terminated; drop the last one
+    return buf.getvalue()[:-1]
 
 
 def format_changes_output(changes_made: Dict, env_changes: Dict[str, str] = None) -> str:
@@ -610,10 +918,10 @@ def format_changes_output(changes_made: Dict, env_changes: Dict[str, str] = None
     if not changes_made and not env_changes:
         return "✅ No changes needed - all ports were available!"
 
-    output_lines = []
-    output_lines.append("🔧 Port Conflict Resolution Summary")
-    output_lines.append("=" * 50)
-    output_lines.append("")
+    buf = io.StringIO()
+    w = buf.write
+    w("🔧 Port Conflict Resolution Summary\n")
+    w("=" * 50 + "\n\n")
 
     total_changes = sum(len(changes) for changes in changes_made.values())
     files_updated = []
@@ -623,21 +931,21 @@ def format_changes_output(changes_made: Dict, env_changes: Dict[str, str] = None
     if env_changes:
         files_updated.append(".env")
 
-    output_lines.append(f"📊 Changed {total_changes} port(s) across {len(changes_made)} service(s)")
+    w(f"📊 Changed {total_changes} port(s) across {len(changes_made)} service(s)\n")
     if files_updated:
-        output_lines.append(f"📝 Updated files: {', '.join(files_updated)}")
-    output_lines.append("")
+        w(f"📝 Updated files: {', '.join(files_updated)}\n")
+    w("\n")
 
     # Show environment variable changes first
     if env_changes:
-        output_lines.append("🌍 Environment Variable Changes:")
+        w("🌍 Environment Variable Changes:\n")
         for env_var, new_value in env_changes.items():
-            output_lines.append(f"   └─ {env_var} = {new_value}")
-        output_lines.append("")
+            w(f"   └─ {env_var} = {new_value}\n")
+        w("\n")
 
     # Show service-specific changes
     for service_name, changes in changes_made.items():
-        output_lines.append(f"🔧 Service: {service_name}")
+        w(f"🔧 Service: {service_name}\n")
         for change in changes:
             old_port = change['old_port']
             new_port = change['new_port']
@@ -654,14 +962,25 @@ def format_changes_output(changes_made: Dict, env_changes: Dict[str, str] = None
             if updated_via_env and env_var:
                 port_display += f" (via ${{{env_var}}})"
 
-            output_lines.append(f"   └─ {port_display}")
-        output_lines.append("")
+            w(f"   └─ {port_display}\n")
+        w("\n")
 
-    return "\n".join(output_lines)
+    # Every line above is newline-terminated; drop the last one
+    return buf.getvalue()[:-1]
 
 
-def format_json_output(services_info: Dict[str, Dict]) -> str:
-    """Format the output as JSON."""
+def _dumps(obj: Any) -> bytes:
+    """Serialize obj to indented JSON bytes, using orjson when it's installed."""
+    # Imported here so runs without --json don't pay for it
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(obj, indent=2).encode()
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
+def build_json_output(services_info: Dict[str, Dict]) -> Dict[str, Any]:
+    """Build the JSON output as a dict, ready to be serialized."""
     # Convert to a more JSON-friendly format
     json_data = {
         "summary": {
@@ -670,7 +989,7 @@ def format_json_output(services_info: Dict[str, Dict]) -> str:
             "ports_in_use": sum(
                 1 for service in services_info.values()
                 for port in service['ports']
-                if not port.get('available', True)
+                if not port.available
             )
         },
         "services": []
@@ -685,20 +1004,31 @@ def format_json_output(services_info: Dict[str, Dict]) -> str:
 
         for port_info in service_info['ports']:
             port_data = {
-                "host_port": port_info['host_port'],
-                "container_port": port_info['container_port'],
-                "protocol": port_info['protocol'],
-                "available": port_info.get('available', True),
-                "process": port_info.get('process'),
-                "docker_container": port_info.get('docker_container'),
-                "env_var": port_info.get('env_var'),
-                "original_mapping": port_info.get('original_mapping')
+                "host_port": port_info.host_port,
+                "container_port": port_info.container_port,
+                "protocol": port_info.protocol,
+                "available": port_info.available,
+                "process": port_info.process,
+                "docker_container": port_info.docker_container,
+                "env_var": port_info.env_var,
+                "original_mapping": port_info.original_mapping
             }
             service_data['ports'].append(port_data)
 
         json_data['services'].append(service_data)
 
-    return json.dumps(json_data, indent=2)
+    return json_data
+
+
+def format_json_output(services_info: Dict[str, Dict]) -> str:
+    """Format the output as JSON."""
+    return json.dumps(build_json_output(services_info), indent=2)
+
+
+def _exit_with_error(*lines: str) -> None:
+    """Write an error banner to stderr in a single call and exit with code 1."""
+    sys.stderr.write('\n'.join(lines) + '\n')
+    sys.exit(1)
 
 
 def main():
@@ -761,29 +1091,42 @@ def main():
         help="Create a backup of the original files when fixing conflicts"
     )
 
-    args = parser.parse_args()
-
-    # Parse port range
-    try:
-        if '-' in args.port_range:
-            start_port, end_port = map(int, args.port_range.split('-'))
-        else:
-            start_port, end_port = int(args.port_range), 65535
-
-        if start_port < 1 or end_port > 65535 or start_port >= end_port:
-            raise ValueError("Invalid port range")
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Show debug logging"
+    )
 
-        port_range = (start_port, end_port)
-    except ValueError:
-        print("❌ Invalid port range. Use format: '8000-9000' or single port number")
-        sys.exit(1)
+    args = parser.parse_args()
+    do_fix = args.fix or args.fix_interactive
+    as_json = args.json
+    interactive = args.fix_interactive
+    warn_only = args.warn_only
+    exit_on_used = args.exit_on_used
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(levelname)s: %(message)s"
+    )
+    if not getattr(yaml, "__with_libyaml__", False):
+        log.debug("PyYAML was built without libyaml, using the slower pure-Python parser")
+
+    # Parse port range ("8000-9000" or a single start port)
+    range_match = _PORT_RANGE_RE.fullmatch(args.port_range.strip())
+    if range_match:
+        start_port = int(range_match.group(1))
+        end_port = int(range_match.group(2)) if range_match.group(2) else 65535
+    if not range_match or start_port < 1 or end_port > 65535 or start_port >= end_port:
+        _exit_with_error("❌ Invalid port range. Use format: '8000-9000' or single port number")
+    port_range = (start_port, end_port)
 
     # Load and parse docker-compose file
     compose_data = load_docker_compose(args.file)
 
-    # Extract environment variable names used for ports
-    port_env_vars = extract_env_port_variables(compose_data)
+    # Extract ports and the environment variable names they use in one traversal
+    services_info, port_env_vars = extract_ports_and_env(compose_data)
     uses_env_vars = len(port_env_vars) > 0
+    port_env_vars_sorted = sorted(port_env_vars)
 
     # Determine .env file path
     env_file_path = None
@@ -792,28 +1135,29 @@ def main():
     if args.env_file:
         # User specified an .env file explicitly
         env_file_path = args.env_file
-        if not os.path.exists(env_file_path):
-            print(f"❌ Error: Specified .env file '{env_file_path}' not found")
-            sys.exit(1)
-        env_vars = load_env_file(env_file_path)
+        try:
+            env_vars = load_env_file(env_file_path)
+        except FileNotFoundError:
+            _exit_with_error(f"❌ Error: Specified .env file '{env_file_path}' not found")
     elif uses_env_vars:
         # Environment variables detected, try to auto-detect .env file
         default_env_path = ".env"
-        if os.path.exists(default_env_path):
+        try:
+            env_vars = load_env_file(default_env_path)
             env_file_path = default_env_path
-            env_vars = load_env_file(env_file_path)
-            if not args.json:
+            if not as_json:
                 print(f"🔍 Auto-detected .env file: {env_file_path}")
-        else:
-            print(f"❌ Error: Environment variables detected in docker-compose file but no .env file found")
-            print(f"   Environment variables used for ports: {', '.join(sorted(port_env_vars))}")
-            print(f"   Please create a .env file or specify the correct path with --env-file")
-            print(f"   Example: check-docker-compose-ports --env-file path/to/your/.env")
-            sys.exit(1)
+        except FileNotFoundError:
+            _exit_with_error(
+                "❌ Error: Environment variables detected in docker-compose file but no .env file found",
+                f"   Environment variables used for ports: {', '.join(port_env_vars_sorted)}",
+                "   Please create a .env file or specify the correct path with --env-file",
+                "   Example: check-docker-compose-ports --env-file path/to/your/.env",
+            )
 
     # Show environment variable detection info
-    if uses_env_vars and not args.json:
-        print(f"🌍 Environment variables detected: {', '.join(sorted(port_env_vars))}")
+    if uses_env_vars and not as_json:
+        print(f"🌍 Environment variables detected: {', '.join(port_env_vars_sorted)}")
         if env_file_path:
             # Check if all required env vars are defined
             missing_vars = port_env_vars - set(env_vars.keys())
@@ -823,24 +1167,22 @@ def main():
                 print(f"✅ All required environment variables found in {env_file_path}")
         print("")
 
-    # Extract service and port information (with env var resolution)
-    services_info = extract_service_ports(compose_data, env_vars)
+    # Only ports using env vars need another pass, now resolved against the .env file
+    if uses_env_vars:
+        _resolve_env_ports(compose_data, services_info, env_vars)
 
-    # Check port usage
-    services_info = check_service_ports(services_info)
+    # Check port usage; the count of ports in use is also reused for the exit code
+    used_ports = _check_service_ports(services_info)
 
     # Check if we need to fix conflicts
-    has_conflicts = any(
-        not port.get('available', True)
-        for service in services_info.values()
-        for port in service['ports']
-    )
+    has_conflicts = used_ports > 0
 
-    if (args.fix or args.fix_interactive) and has_conflicts:
+    if do_fix and has_conflicts:
         if not env_file_path and uses_env_vars:
-            print("❌ Error: Cannot fix conflicts without a valid .env file")
-            print("   Please specify the .env file path with --env-file")
-            sys.exit(1)
+            _exit_with_error(
+                "❌ Error: Cannot fix conflicts without a valid .env file",
+                "   Please specify the .env file path with --env-file",
+            )
 
         # Create backups if requested
         if args.backup:
@@ -850,17 +1192,20 @@ def main():
             print(f"💾 Backup created: {backup_path}")
 
             # Backup .env file if it exists
-            if env_file_path and os.path.exists(env_file_path):
+            if env_file_path:
                 env_backup_path = env_file_path + '.backup'
-                shutil.copy2(env_file_path, env_backup_path)
-                print(f"💾 Backup created: {env_backup_path}")
+                try:
+                    shutil.copy2(env_file_path, env_backup_path)
+                    print(f"💾 Backup created: {env_backup_path}")
+                except FileNotFoundError:
+                    pass
 
         # Resolve conflicts
         print("🔧 Resolving port conflicts...")
         changes_made, env_changes = resolve_port_conflicts(
             compose_data,
             services_info,
-            interactive=args.fix_interactive,
+            interactive=interactive,
             port_range=port_range,
             env_vars=env_vars,
             env_file_path=env_file_path
@@ -881,37 +1226,28 @@ def main():
 
             # Show changes summary
             print("\n" + format_changes_output(changes_made, env_changes))
-
-            # Re-check the ports to show the updated status
-            services_info = extract_service_ports(compose_data, env_vars)
-            services_info = check_service_ports(services_info)
         else:
             print("✅ No conflicts found to resolve")
 
     # Output results
-    if not (args.fix or args.fix_interactive) or not has_conflicts:
-        if args.json:
+    if not do_fix or not has_conflicts:
+        if as_json:
             # Add environment variable info to JSON output
-            json_output = json.loads(format_json_output(services_info))
+            json_output = build_json_output(services_info)
             json_output["environment"] = {
                 "uses_env_vars": uses_env_vars,
                 "env_file_path": env_file_path,
-                "env_vars_detected": sorted(port_env_vars) if port_env_vars else [],
+                "env_vars_detected": port_env_vars_sorted,
                 "env_vars_loaded": len(env_vars) if env_vars else 0
             }
-            print(json.dumps(json_output, indent=2))
+            sys.stdout.flush()
+            sys.stdout.buffer.write(_dumps(json_output) + b'\n')
         else:
             output = format_beautiful_output(services_info, env_file_path, uses_env_vars)
             print(output)
 
     # Handle exit codes
-    used_ports = sum(
-        1 for service in services_info.values()
-        for port in service['ports']
-        if not port.get('available', True)
-    )
-
-    if used_ports > 0 and args.exit_on_used and not (args.fix or args.fix_interactive):
+    if used_ports > 0 and exit_on_used and not do_fix:
         sys.exit(1)
-    elif used_ports > 0 and not args.warn_only and not (args.fix or args.fix_interactive):
+    elif used_ports > 0 and not warn_only and not do_fix:
         sys.exit(1)
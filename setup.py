@@ -27,9 +27,18 @@ setup(
     ],
     python_requires=">=3.7",
     install_requires=[
+        # Install the libyaml system package before PyYAML to get its much
+        # faster C loader, which is picked up automatically when available
         "PyYAML>=5.4.0",
-        "psutil>=5.8.0",
+        # Linux reads listening ports from /proc; psutil only adds process details there
+        'psutil>=5.8.0; sys_platform != "linux"',
     ],
+    extras_require={
+        # Faster serializer for --json output
+        "fast": ["orjson>=3.9"],
+        # Process details (PID and name) for conflicting ports on Linux too
+        "crossplatform": ["psutil>=5.8.0"],
+    },
     entry_points={
         "console_scripts": [
             "check-docker-compose-ports=check_docker_compose_ports.cli:main",